@@ -1,20 +1,162 @@
 import sqlite3
-from typing import List, Tuple
+from typing import Iterable, List, Optional, Tuple
 from models import Campaign, Recipient
-import datetime
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+import atexit
+import queue
 import threading
+import time
 
 DB_PATH = "bemanager.db"
-_lock = threading.Lock()
+READ_POOL_SIZE = 4
+
+# One writer connection serialized by _write_lock, plus a pool of reader connections
+# that are reused across calls instead of re-opening the database file each time.
+# Readers never take _write_lock: under WAL, SQLite lets them run concurrently with
+# the single writer, so the lock only serializes use of the writer connection.
+_write_lock = threading.Lock()
+_writer = None
+_pool = queue.Queue(maxsize=READ_POOL_SIZE)
+
+# Rows returned by the read API; built from explicit column lists so the order is fixed
+CampaignRow = namedtuple("CampaignRow", "id name subject body created_at")
+RecipientRow = namedtuple("RecipientRow", "id campaign_id email name status last_error attempts responded_at")
+
+# Readers map the database file (SQLite maps at most the current file size) and read
+# pages straight from the OS page cache, which every pooled connection shares, instead
+# of copying them into each connection's private cache. This reserves up to this much
+# virtual address space per connection; writes still go through normal file I/O.
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Per-connection settings; journal_mode=WAL is persistent and set once in init_db().
+_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=memory",
+    "PRAGMA cache_size=-64000",
+    f"PRAGMA mmap_size={MMAP_SIZE}",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Size of sqlite3's per-connection prepared-statement cache. It has to hold the fixed
+# queries, every UPDATE variant and the multi-row INSERT templates, or the writer
+# re-prepares statements it just evicted.
+CACHED_STATEMENTS = 256
 
 def _connect():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
+    # isolation_level=None: transactions are opened explicitly by _writer_conn().
+    # Rows come back as plain tuples; the read API builds its namedtuples itself.
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None,
+                           cached_statements=CACHED_STATEMENTS)
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-def init_db():
-    with _lock:
+def _get_writer():
+    # caller must hold _write_lock
+    global _writer
+    if _writer is None:
+        _writer = _connect()
+    return _writer
+
+@contextmanager
+def _writer_conn(bulk: bool = False):
+    """
+    Yield the shared writer connection inside a BEGIN IMMEDIATE ... COMMIT block.
+    With bulk=True the transaction runs with synchronous=OFF, for large loads that can be redone.
+    """
+    with _write_lock:
+        conn = _get_writer()
+        if bulk:
+            # the sync level can only be changed outside a transaction
+            conn.execute("PRAGMA synchronous=OFF")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            if bulk:
+                conn.execute("PRAGMA synchronous=NORMAL")
+
+@contextmanager
+def _borrow():
+    """
+    Borrow a reader connection from the pool; it is returned (or closed if the pool is full) on exit.
+    """
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
         conn = _connect()
+    try:
+        yield conn
+    finally:
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+# Recipient status is stored as a small integer; the API speaks in the names.
+STATUS = {"pending": 0, "sent": 1, "failed": 2, "responded": 3}
+STATUS_NAMES = {code: name for name, code in STATUS.items()}
+
+_RECIPIENTS_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    campaign_id INTEGER,
+    email TEXT NOT NULL,
+    name TEXT,
+    status INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    attempts INTEGER DEFAULT 0,
+    responded_at TEXT,
+    FOREIGN KEY(campaign_id) REFERENCES campaigns(id)
+)
+"""
+
+def _add_column_if_missing(cur, table: str, column: str, decl: str):
+    if column not in {r[1] for r in cur.execute(f"PRAGMA table_info({table})")}:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def _drop_column_if_present(cur, table: str, column: str):
+    # ALTER TABLE ... DROP COLUMN needs SQLite >= 3.35; older versions keep the column
+    if sqlite3.sqlite_version_info < (3, 35, 0):
+        return
+    if column in {r[1] for r in cur.execute(f"PRAGMA table_info({table})")}:
+        cur.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+
+def _migrate_status_to_integer(cur):
+    """
+    Rebuild a recipients table created with the old TEXT status column.
+    """
+    columns = {r[1]: r[2] for r in cur.execute("PRAGMA table_info(recipients)")}
+    if columns.get("status", "").upper() != "TEXT":
+        return
+    decode = " ".join(f"WHEN status LIKE '{name}%' THEN {code}" for name, code in STATUS.items())
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute(_RECIPIENTS_DDL.format(table="recipients_migrated"))
+        cur.execute(f"""
+            INSERT INTO recipients_migrated (id, campaign_id, email, name, status, last_error, attempts)
+            SELECT id, campaign_id, email, name, CASE {decode} ELSE {STATUS["pending"]} END, last_error, attempts
+            FROM recipients
+        """)
+        cur.execute("DROP TABLE recipients")
+        cur.execute("ALTER TABLE recipients_migrated RENAME TO recipients")
+    except BaseException:
+        # leave the old table untouched and the writer connection out of a transaction
+        cur.execute("ROLLBACK")
+        raise
+    cur.execute("COMMIT")
+
+def init_db():
+    with _write_lock:
+        conn = _get_writer()
+        # WAL lets readers run alongside the writer and avoids a full fsync per commit
+        conn.execute("PRAGMA journal_mode=WAL")
         cur = conn.cursor()
         cur.executescript("""
         CREATE TABLE IF NOT EXISTS campaigns (
@@ -22,17 +164,7 @@ def init_db():
             name TEXT NOT NULL,
             subject TEXT,
             body TEXT,
-            created_at TEXT
-        );
-        CREATE TABLE IF NOT EXISTS recipients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            campaign_id INTEGER,
-            email TEXT NOT NULL,
-            name TEXT,
-            status TEXT DEFAULT 'pending',
-            last_error TEXT,
-            attempts INTEGER DEFAULT 0,
-            FOREIGN KEY(campaign_id) REFERENCES campaigns(id)
+            created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
         );
         CREATE TABLE IF NOT EXISTS campaign_stats (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -45,87 +177,392 @@ def init_db():
             FOREIGN KEY(campaign_id) REFERENCES campaigns(id)
         );
         """)
-        conn.commit()
-        conn.close()
+        cur.execute(_RECIPIENTS_DDL.format(table="recipients"))
+        _migrate_status_to_integer(cur)
+        _add_column_if_missing(cur, "recipients", "responded_at", "TEXT")
+        _drop_column_if_present(cur, "recipients", "previous_status")
+        cur.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_recipients_campaign ON recipients(campaign_id);
+        CREATE INDEX IF NOT EXISTS idx_recipients_campaign_status ON recipients(campaign_id, status);
+        CREATE INDEX IF NOT EXISTS idx_recipients_campaign_email ON recipients(campaign_id, LOWER(email));
+        CREATE INDEX IF NOT EXISTS idx_campaign_stats_campaign ON campaign_stats(campaign_id);
+        """)
+        # Gather planner statistics once, the first time the indexes exist
+        if cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is None:
+            cur.execute("ANALYZE")
+    _start_writer_thread()
 
 def create_campaign(name: str, subject: str, body: str) -> int:
-    created_at = datetime.datetime.utcnow().isoformat()
-    with _lock:
-        conn = _connect()
+    with _writer_conn() as conn:
         cur = conn.cursor()
-        cur.execute("INSERT INTO campaigns (name, subject, body, created_at) VALUES (?, ?, ?, ?)",
-                    (name, subject, body, created_at))
+        # The timestamp is computed by SQLite; it is spelled out here (not left to the column
+        # default) because databases created before that default existed lack it.
+        cur.execute("INSERT INTO campaigns (name, subject, body, created_at) "
+                    "VALUES (?, ?, ?, strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))",
+                    (name, subject, body))
         cid = cur.lastrowid
 
         # Initialize stats row for this campaign
         cur.execute("INSERT INTO campaign_stats (campaign_id, total_recipients) VALUES (?, ?)", (cid, 0))
-
-        conn.commit()
-        conn.close()
     return cid
 
-def add_recipients(campaign_id: int, recipients: List[Tuple[str, str]]):
-    with _lock:
-        conn = _connect()
-        cur = conn.cursor()
-        cur.executemany("INSERT INTO recipients (campaign_id, email, name) VALUES (?, ?, ?)",
-                        [(campaign_id, r[0], r[1]) for r in recipients])
-
-        # Update total_recipients in stats
-        cur.execute("""
-            UPDATE campaign_stats
-            SET total_recipients = (SELECT COUNT(*) FROM recipients WHERE campaign_id = ?)
-            WHERE campaign_id = ?
-        """, (campaign_id, campaign_id))
-
-        conn.commit()
-        conn.close()
-
-def get_campaigns():
-    conn = _connect()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM campaigns ORDER BY created_at DESC")
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
-
-def get_recipients_for_campaign(campaign_id: int):
-    conn = _connect()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM recipients WHERE campaign_id = ?", (campaign_id,))
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
-
-def update_recipient_status(recipient_id: int, status: str, last_error: str = None, attempts: int = None):
-    with _lock:
-        conn = _connect()
+# Small imports go through one multi-row INSERT; the statement for each batch size
+# is kept in a bounded LRU so the set of distinct SQL texts stays small.
+MULTIROW_INSERT_MAX = 128
+_MULTIROW_SQL_CACHE_SIZE = 64
+_multirow_insert_sql = OrderedDict()
+
+def _get_multirow_insert_sql(n: int) -> str:
+    # caller must hold _write_lock
+    sql = _multirow_insert_sql.get(n)
+    if sql is None:
+        sql = "INSERT INTO recipients (campaign_id, email, name) VALUES " + ", ".join(["(?, ?, ?)"] * n)
+        _multirow_insert_sql[n] = sql
+        if len(_multirow_insert_sql) > _MULTIROW_SQL_CACHE_SIZE:
+            _multirow_insert_sql.popitem(last=False)
+    else:
+        _multirow_insert_sql.move_to_end(n)
+    return sql
+
+def add_recipients(campaign_id: int, recipients: Iterable[Tuple[str, str]], count: Optional[int] = None):
+    """
+    Insert (email, name) pairs. `recipients` may be any iterable (e.g. a zip over separate
+    email and name columns) if `count` gives its length; it is consumed once, in a single pass.
+    """
+    if count is None:
+        count = len(recipients)
+    if not count:
+        return
+    bulk = count > MULTIROW_INSERT_MAX
+    with _writer_conn(bulk=bulk) as conn:
         cur = conn.cursor()
+        if not bulk:
+            cur.execute(_get_multirow_insert_sql(count),
+                        [v for e, n in recipients for v in (campaign_id, e, n)])
+        else:
+            cur.executemany("INSERT INTO recipients (campaign_id, email, name) VALUES (?, ?, ?)",
+                            ((campaign_id, e, n) for e, n in recipients))
 
-        # Get campaign_id before updating
-        cur.execute("SELECT campaign_id FROM recipients WHERE id = ?", (recipient_id,))
-        row = cur.fetchone()
-        if not row:
-            conn.close()
+        # Update total_recipients in stats without re-counting the table
+        cur.execute("UPDATE campaign_stats SET total_recipients = COALESCE(total_recipients, 0) + ? WHERE campaign_id = ?",
+                    (count, campaign_id))
+        cached = _stats.get(campaign_id)
+        if cached is not None:
+            cached["total"] += count
+
+def get_campaigns() -> List[CampaignRow]:
+    with _borrow() as conn:
+        cur = conn.execute("SELECT id, name, subject, body, created_at FROM campaigns ORDER BY created_at DESC")
+        return list(map(CampaignRow._make, cur))
+
+def get_campaign(campaign_id: int) -> Optional[CampaignRow]:
+    with _borrow() as conn:
+        row = conn.execute("SELECT id, name, subject, body, created_at FROM campaigns WHERE id = ?",
+                           (campaign_id,)).fetchone()
+    return CampaignRow._make(row) if row else None
+
+# Statuses the sender picks up: rows that were never sent or whose last attempt failed
+DISPATCH_STATUSES = ("pending", "failed")
+
+# Rows fetched per query by iter_recipients_for_campaign
+RECIPIENT_PAGE_SIZE = 500
+
+def _recipient_filter(campaign_id: int, statuses, max_attempts, dedupe):
+    where = "campaign_id = ?"
+    params = [campaign_id]
+    if dedupe:
+        # the lowest-id row stands for every (case-insensitive) copy of an address and
+        # carries its delivery state, so a duplicate of an already-sent row is never picked.
+        # Probed per row through idx_recipients_campaign_email, so each page stays cheap.
+        where += (" AND NOT EXISTS (SELECT 1 FROM recipients d WHERE d.campaign_id = recipients.campaign_id"
+                  " AND LOWER(d.email) = LOWER(recipients.email) AND d.id < recipients.id)")
+    if statuses is not None:
+        where += f" AND status IN ({', '.join('?' * len(statuses))})"
+        params += [STATUS[s] for s in statuses]
+    if max_attempts is not None:
+        where += " AND COALESCE(attempts, 0) < ?"
+        params.append(max_attempts)
+    return where, params
+
+def iter_recipients_for_campaign(campaign_id: int, statuses: Optional[Tuple[str, ...]] = None,
+                                 max_attempts: Optional[int] = None, dedupe: bool = False):
+    """
+    Lazily yield RecipientRow tuples in id order, keeping memory flat for large campaigns.
+    Optionally restrict to the given statuses and to rows with fewer than max_attempts attempts;
+    with dedupe, duplicate addresses are represented by their lowest-id row only.
+
+    Rows are fetched a page at a time by keyset (id > last id seen), borrowing a connection
+    per page, so no read transaction stays open while the caller works through the rows;
+    a long-lived one would keep WAL checkpoints from resetting the log.
+    """
+    where, params = _recipient_filter(campaign_id, statuses, max_attempts, dedupe)
+    sql = ("SELECT id, campaign_id, email, name, status, last_error, attempts, responded_at "
+           f"FROM recipients WHERE {where} AND id > ? ORDER BY id LIMIT {RECIPIENT_PAGE_SIZE}")
+    last_id = 0
+    while True:
+        with _borrow() as conn:
+            rows = conn.execute(sql, params + [last_id]).fetchall()
+        for r in rows:
+            yield RecipientRow(r[0], r[1], r[2], r[3], STATUS_NAMES[r[4]], r[5], r[6], r[7])
+        if len(rows) < RECIPIENT_PAGE_SIZE:
             return
-        campaign_id = row["campaign_id"]
+        last_id = rows[-1][0]
 
-        # Update recipient status
-        if attempts is not None:
-            cur.execute("UPDATE recipients SET status = ?, last_error = ?, attempts = ? WHERE id = ?",
-                        (status, last_error, attempts, recipient_id))
-        else:
-            cur.execute("UPDATE recipients SET status = ?, last_error = ? WHERE id = ?",
-                        (status, last_error, recipient_id))
-
-        # Update campaign_stats
-        cur.execute("""
-            UPDATE campaign_stats
-            SET sent_count = (SELECT COUNT(*) FROM recipients WHERE campaign_id = ? AND status LIKE 'sent%'),
-                failed_count = (SELECT COUNT(*) FROM recipients WHERE campaign_id = ? AND status LIKE 'failed%'),
-                responded_count = (SELECT COUNT(*) FROM recipients WHERE campaign_id = ? AND status LIKE 'responded%')
-            WHERE campaign_id = ?
-        """, (campaign_id, campaign_id, campaign_id, campaign_id))
-
-        conn.commit()
-        conn.close()
+def get_recipients_for_campaign(campaign_id: int, statuses: Optional[Tuple[str, ...]] = None,
+                                max_attempts: Optional[int] = None, dedupe: bool = False) -> List[RecipientRow]:
+    return list(iter_recipients_for_campaign(campaign_id, statuses, max_attempts, dedupe))
+
+def count_recipients(campaign_id: int, statuses: Optional[Tuple[str, ...]] = None,
+                     max_attempts: Optional[int] = None, dedupe: bool = False) -> int:
+    where, params = _recipient_filter(campaign_id, statuses, max_attempts, dedupe)
+    with _borrow() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM recipients WHERE {where}", params).fetchone()[0]
+
+# Columns update_recipient_status only writes when a value is given; bit i of the
+# mask is set when the i-th column is present.
+_OPTIONAL_RECIPIENT_COLUMNS = ("attempts", "responded_at")
+
+def _build_update_recipient_sql(mask: int) -> str:
+    parts = ["status = ?", "last_error = ?"]
+    parts += [f"{col} = ?" for i, col in enumerate(_OPTIONAL_RECIPIENT_COLUMNS) if mask & (1 << i)]
+    return f"UPDATE recipients SET {', '.join(parts)} WHERE id = ?"
+
+# Every UPDATE variant is built once at import, indexed by mask, so the statement
+# text stays identical between calls and hits sqlite3's statement cache.
+_UPDATE_RECIPIENT_SQL = [_build_update_recipient_sql(mask)
+                         for mask in range(1 << len(_OPTIONAL_RECIPIENT_COLUMNS))]
+
+# Position of each counted status in the (sent, failed, responded) delta tuple
+_STAT_INDEX = {STATUS["sent"]: 0, STATUS["failed"]: 1, STATUS["responded"]: 2}
+
+_UPDATE_STATS_SQL = """
+    UPDATE campaign_stats
+    SET sent_count = sent_count + ?,
+        failed_count = failed_count + ?,
+        responded_count = responded_count + ?
+    WHERE campaign_id = ?
+"""
+
+def _stat_deltas(old_status: int, new_status: int) -> List[int]:
+    """
+    Return the [sent, failed, responded] counter changes for one status transition.
+    """
+    deltas = [0, 0, 0]
+    if old_status != new_status:
+        if old_status in _STAT_INDEX:
+            deltas[_STAT_INDEX[old_status]] -= 1
+        if new_status in _STAT_INDEX:
+            deltas[_STAT_INDEX[new_status]] += 1
+    return deltas
+
+# Per-campaign counters kept in memory and mutated on every status transition (always
+# under _write_lock). The deltas are queued and the writer thread coalesces them into
+# campaign_stats every STATS_FLUSH_INTERVAL seconds, so the table is a checkpoint
+# rather than something the sender's hot path has to write.
+STATS_FLUSH_INTERVAL = 0.5
+_stats = {}
+_stats_q = queue.Queue()
+
+def _record_stat_deltas(campaign_id: int, deltas: List[int]):
+    # caller must hold _write_lock
+    cached = _stats.get(campaign_id)
+    if cached is not None:
+        cached["sent_count"] += deltas[0]
+        cached["failed_count"] += deltas[1]
+        cached["responded_count"] += deltas[2]
+    _stats_q.put((campaign_id, deltas))
+
+def _collect_stat_rows() -> List[Tuple[int, int, int, int]]:
+    # Sum every queued delta per campaign into _UPDATE_STATS_SQL parameter rows
+    totals = {}
+    while True:
+        try:
+            campaign_id, deltas = _stats_q.get_nowait()
+        except queue.Empty:
+            break
+        acc = totals.setdefault(campaign_id, [0, 0, 0])
+        for i in range(3):
+            acc[i] += deltas[i]
+    return [(d[0], d[1], d[2], cid) for cid, d in totals.items() if any(d)]
+
+def flush_stats():
+    """
+    Write every queued counter delta to campaign_stats in one transaction.
+    """
+    rows = _collect_stat_rows()
+    if rows:
+        with _writer_conn() as conn:
+            conn.executemany(_UPDATE_STATS_SQL, rows)
+
+# Group commit: single-row writes are queued to one writer thread, which applies
+# everything waiting at that moment (up to GROUP_COMMIT_MAX_OPS) in one transaction
+# and commits once, instead of paying a WAL sync per call. Each op runs inside its own
+# savepoint so a failing op is rolled back and reported without failing the batch.
+GROUP_COMMIT_MAX_OPS = 500
+_write_q = queue.Queue()
+_writer_thread = None
+_writer_thread_lock = threading.Lock()
+
+class _WriteOp:
+    __slots__ = ("fn", "args", "done", "result", "error")
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+def _submit_write(fn, *args):
+    """
+    Run fn(conn, *args) in the next group commit and return its result once committed.
+    """
+    _start_writer_thread()
+    op = _WriteOp(fn, args)
+    _write_q.put(op)
+    op.done.wait()
+    if op.error is not None:
+        raise op.error
+    return op.result
+
+def _commit_batch(ops: List[_WriteOp], stat_rows: List[Tuple[int, int, int, int]]):
+    with _writer_conn() as conn:
+        for op in ops:
+            conn.execute("SAVEPOINT write_op")
+            try:
+                op.result = op.fn(conn, *op.args)
+            except Exception as e:
+                op.error = e
+                conn.execute("ROLLBACK TO write_op")
+            conn.execute("RELEASE write_op")
+        if stat_rows:
+            conn.executemany(_UPDATE_STATS_SQL, stat_rows)
+
+def _writer_loop():
+    last_stats_flush = time.monotonic()
+    while True:
+        try:
+            ops = [_write_q.get(timeout=STATS_FLUSH_INTERVAL)]
+        except queue.Empty:
+            ops = []
+        while len(ops) < GROUP_COMMIT_MAX_OPS:
+            try:
+                ops.append(_write_q.get_nowait())
+            except queue.Empty:
+                break
+
+        # counter checkpoints ride along with the batch that is being committed anyway
+        stat_rows = []
+        if time.monotonic() - last_stats_flush >= STATS_FLUSH_INTERVAL:
+            stat_rows = _collect_stat_rows()
+            last_stats_flush = time.monotonic()
+        if ops or stat_rows:
+            try:
+                _commit_batch(ops, stat_rows)
+            except Exception as e:
+                for op in ops:
+                    op.error = e
+        for op in ops:
+            op.done.set()
+
+def _start_writer_thread():
+    global _writer_thread
+    if _writer_thread is not None:
+        return
+    with _writer_thread_lock:
+        if _writer_thread is None:
+            _writer_thread = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+            _writer_thread.start()
+            # drain whatever counter deltas are still queued when the process exits
+            atexit.register(flush_stats)
+
+def get_campaign_stats(campaign_id: int) -> dict:
+    """
+    Return sent/failed/responded/total counts for a campaign. Served from memory once
+    loaded; the first call counts the recipients per status in one index scan.
+    """
+    cached = _stats.get(campaign_id)
+    if cached is None:
+        # Counted under the writer lock so no transition lands between the scan and
+        # the cache entry being published (it would otherwise be missed or doubled).
+        with _write_lock:
+            cached = _stats.get(campaign_id)
+            if cached is None:
+                counts = dict(_get_writer().execute(
+                    "SELECT status, COUNT(*) FROM recipients WHERE campaign_id = ? GROUP BY status", (campaign_id,)))
+                cached = {
+                    "sent_count": counts.get(STATUS["sent"], 0),
+                    "failed_count": counts.get(STATUS["failed"], 0),
+                    "responded_count": counts.get(STATUS["responded"], 0),
+                    "total": sum(counts.values()),
+                }
+                _stats[campaign_id] = cached
+    return dict(cached)
+
+def update_recipient_status(recipient_id: int, status: str, last_error: str = None, attempts: int = None,
+                            responded_at: str = None):
+    # Pick the statement and bind parameters on the caller's thread
+    code = STATUS[status]
+    mask = 0
+    params = [code, last_error]
+    for i, value in enumerate((attempts, responded_at)):
+        if value is not None:
+            mask |= 1 << i
+            params.append(value)
+    params.append(recipient_id)
+    _submit_write(_apply_recipient_status, _UPDATE_RECIPIENT_SQL[mask], params, recipient_id, code)
+
+def _apply_recipient_status(conn, sql: str, params: list, recipient_id: int, code: int):
+    # runs on the writer thread inside a group commit
+    # Read campaign_id and the previous status, then update; both run in the same
+    # transaction so nothing can change the row in between
+    row = conn.execute("SELECT campaign_id, status FROM recipients WHERE id = ?", (recipient_id,)).fetchone()
+    if row:
+        conn.execute(sql, params)
+    if not row:
+        return
+    campaign_id, old_status = row
+
+    # Update the campaign counters incrementally instead of re-counting the campaign
+    deltas = _stat_deltas(old_status, code)
+    if any(deltas):
+        _record_stat_deltas(campaign_id, deltas)
+
+
+def bulk_update_recipient_status(updates: List[Tuple[int, str, Optional[str], Optional[int]]]):
+    """
+    Apply many (recipient_id, status, last_error, attempts) updates in one transaction.
+    attempts may be None to leave the stored value unchanged. The campaign counters are
+    kept consistent by summing the per-campaign deltas of every transition in the batch.
+    """
+    if not updates:
+        return
+    updates = [(rid, STATUS[status], last_error, attempts) for rid, status, last_error, attempts in updates]
+    with _writer_conn() as conn:
+        # Current (campaign_id, status) for every touched recipient, fetched in chunks
+        ids = list({u[0] for u in updates})
+        current = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for rid, campaign_id, status in conn.execute(
+                    f"SELECT id, campaign_id, status FROM recipients WHERE id IN ({marks})", chunk):
+                current[rid] = [campaign_id, status]
+
+        campaign_deltas = {}
+        for rid, status, _, _ in updates:
+            cur_row = current.get(rid)
+            if cur_row is None:
+                continue
+            campaign_id, old_status = cur_row
+            d = _stat_deltas(old_status, status)
+            acc = campaign_deltas.setdefault(campaign_id, [0, 0, 0])
+            for j in range(3):
+                acc[j] += d[j]
+            cur_row[1] = status
+
+        conn.executemany("UPDATE recipients SET status = ?, last_error = ?, attempts = COALESCE(?, attempts) WHERE id = ?",
+                         ((status, last_error, attempts, rid) for rid, status, last_error, attempts in updates))
+        for cid, d in campaign_deltas.items():
+            if any(d):
+                _record_stat_deltas(cid, d)
@@ -1,17 +1,21 @@
 # main.py
 import sys
 import csv
-import re
+import queue
+import threading
+from contextlib import contextmanager
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QTabWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QPushButton, QTextEdit, QLineEdit, QFileDialog, QProgressBar,
     QTableWidget, QTableWidgetItem, QMessageBox, QSpinBox, QDialog, QFormLayout,
     QCheckBox, QDialogButtonBox, QInputDialog
 )
-from PySide6.QtCore import Qt, QThread, Slot
+from PySide6.QtCore import Qt, QTimer, Slot
+from PySide6.QtGui import QColor, QPalette
 import db
 from models import Campaign
 from sender import SenderWorker
+from validation import is_valid_email
 import os
 
 # import the settings helper
@@ -20,17 +24,39 @@ import settings as settings_module
 APP_STYLE = """
 QMainWindow { background-color: #1a2332; color: #ffffff; }
 QTabBar::tab { background: #172026; color: #FFD700; padding: 8px; margin: 2px; border-radius: 6px; }
-QWidget { color: #e6eef7; }
 QPushButton { background: #233044; color: #FFD700; padding: 6px; border-radius: 6px; }
 QLineEdit, QTextEdit { background: #0f1720; color: #e6eef7; border: 1px solid #2b3948; padding: 6px; border-radius: 4px; }
-QProgressBar { background: #0f1720; color: #e6eef7; border: 1px solid #2b3948; }
 """
 
-EMAIL_REGEX = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+# Colours for widgets repainted on every progress tick. They are set through QPalette
+# rather than APP_STYLE so stylesheet rules are not resolved on each setText/setValue.
+TEXT_COLOR = QColor("#e6eef7")
+PROGRESS_BASE_COLOR = QColor("#0f1720")
 
 
-def is_valid_email(email: str) -> bool:
-    return EMAIL_REGEX.match(email) is not None
+def apply_text_palette(app: QApplication):
+    pal = app.palette()
+    pal.setColor(QPalette.ColorRole.WindowText, TEXT_COLOR)
+    pal.setColor(QPalette.ColorRole.Text, TEXT_COLOR)
+    app.setPalette(pal)
+
+
+@contextmanager
+def bulk_table_update(tbl: QTableWidget):
+    """
+    Suspend repaints, sorting and signals while a QTableWidget is repopulated, so the
+    view is invalidated once at the end instead of once per inserted row.
+    """
+    sorting = tbl.isSortingEnabled()
+    tbl.setUpdatesEnabled(False)
+    tbl.setSortingEnabled(False)
+    tbl.blockSignals(True)
+    try:
+        yield
+    finally:
+        tbl.blockSignals(False)
+        tbl.setSortingEnabled(sorting)
+        tbl.setUpdatesEnabled(True)
 
 
 class SmtpSettingsDialog(QDialog):
@@ -152,6 +178,11 @@ class EmailManagementTab(QWidget):
         self.sent_progress = QProgressBar()
         self.failed_progress = QProgressBar()
         self.responded_progress = QProgressBar()
+        progress_pal = self.progress.palette()
+        progress_pal.setColor(QPalette.ColorRole.Base, PROGRESS_BASE_COLOR)
+        progress_pal.setColor(QPalette.ColorRole.Text, TEXT_COLOR)
+        for bar in (self.progress, self.sent_progress, self.failed_progress, self.responded_progress):
+            bar.setPalette(progress_pal)
 
         layout.addWidget(QLabel("<b>Email Management</b>"))
         layout.addWidget(self.campaign_name)
@@ -175,7 +206,9 @@ class EmailManagementTab(QWidget):
         layout.addWidget(self.progress)
         self.setLayout(layout)
 
-        self.loaded_recipients = []  # list of (email, name)
+        # loaded CSV recipients as parallel columns rather than one tuple per row
+        self.emails = []
+        self.names = []
         self.loaded_smtp = None  # dict with smtp settings
 
     def open_smtp_settings(self):
@@ -200,30 +233,33 @@ class EmailManagementTab(QWidget):
         path, _ = QFileDialog.getOpenFileName(self, "Open CSV", "", "CSV Files (*.csv)")
         if not path:
             return
-        self.loaded_recipients.clear()
+        # parse and validate in one pass; validation.is_valid_email is the single source of the rules
+        is_valid = is_valid_email
+        emails, names = [], []
         invalid_count = 0
         with open(path, newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
+            for row in csv.reader(f):
                 if not row:
                     continue
                 email = row[0].strip()
-                name = row[1].strip() if len(row) > 1 else ""
-                if not is_valid_email(email):
+                if is_valid(email):
+                    emails.append(email)
+                    names.append(row[1].strip() if len(row) > 1 else "")
+                else:
                     invalid_count += 1
-                    continue
-                self.loaded_recipients.append((email, name))
+        self.emails, self.names = emails, names
         self.refresh_preview()
         if invalid_count:
             QMessageBox.warning(self, "Invalid emails", f"Skipped {invalid_count} invalid email(s) while loading CSV.")
 
     def refresh_preview(self):
-        self.preview_table.setRowCount(0)
-        for e, n in self.loaded_recipients:
-            r = self.preview_table.rowCount()
-            self.preview_table.insertRow(r)
-            self.preview_table.setItem(r, 0, QTableWidgetItem(e))
-            self.preview_table.setItem(r, 1, QTableWidgetItem(n))
+        tbl = self.preview_table
+        with bulk_table_update(tbl):
+            tbl.setRowCount(0)
+            tbl.setRowCount(len(self.emails))
+            for r, (e, n) in enumerate(zip(self.emails, self.names)):
+                tbl.setItem(r, 0, QTableWidgetItem(e))
+                tbl.setItem(r, 1, QTableWidgetItem(n))
 
     def create_campaign(self):
         name = self.campaign_name.text().strip()
@@ -233,7 +269,7 @@ class EmailManagementTab(QWidget):
             QMessageBox.warning(self, "Missing", "Please fill campaign name, subject and body")
             return
         cid = db.create_campaign(name, subject, body)
-        db.add_recipients(cid, self.loaded_recipients)
+        db.add_recipients(cid, zip(self.emails, self.names), len(self.emails))
         QMessageBox.information(self, "Created", f"Campaign {name} created with id {cid}")
         self.parent.refresh_campaigns()
 
@@ -281,15 +317,9 @@ class EmailManagementTab(QWidget):
         use_tls = bool(smtp.get("use_tls", False))
         concurrency = self.concurrency.value()
         # trigger start in MainWindow (this will reset counters there)
-        self.parent.start_sender_thread(campaign['id'], campaign['subject'], campaign['body'],
+        self.parent.start_sender_thread(campaign.id, campaign.subject, campaign.body,
                                         smtp_host, smtp_port, concurrency, smtp_user, smtp_pass, use_tls)
 
-    @Slot(int, int)
-    def on_progress(self, sent, total):
-        # keep existing progress bar behavior (overall)
-        self.progress.setMaximum(total)
-        self.progress.setValue(sent)
-
 
 class CampaignHistoryTab(QWidget):
     def __init__(self, parent):
@@ -308,14 +338,16 @@ class CampaignHistoryTab(QWidget):
 
     def refresh(self):
         rows = db.get_campaigns()
-        self.tbl.setRowCount(0)
-        for r in rows:
-            idx = self.tbl.rowCount()
-            self.tbl.insertRow(idx)
-            self.tbl.setItem(idx, 0, QTableWidgetItem(str(r['id'])))
-            self.tbl.setItem(idx, 1, QTableWidgetItem(r['name']))
-            self.tbl.setItem(idx, 2, QTableWidgetItem(r['created_at']))
-            self.tbl.setItem(idx, 3, QTableWidgetItem(r['subject']))
+        # keep the fetched rows so the selected campaign can be returned without a query
+        self.campaigns_by_id = {r.id: r for r in rows}
+        with bulk_table_update(self.tbl):
+            self.tbl.setRowCount(0)
+            self.tbl.setRowCount(len(rows))
+            for idx, r in enumerate(rows):
+                self.tbl.setItem(idx, 0, QTableWidgetItem(str(r.id)))
+                self.tbl.setItem(idx, 1, QTableWidgetItem(r.name))
+                self.tbl.setItem(idx, 2, QTableWidgetItem(r.created_at))
+                self.tbl.setItem(idx, 3, QTableWidgetItem(r.subject))
 
 
 class DataCleaningTab(QWidget):
@@ -350,6 +382,18 @@ class MainWindow(QMainWindow):
         self.sender_thread = None
         self.sender_worker = None
 
+        # coalesce realtime indicator refreshes to at most one per 30 ms
+        self._ui_dirty = False
+        self._ui_timer = QTimer(self)
+        self._ui_timer.setSingleShot(True)
+        self._ui_timer.setInterval(30)
+        self._ui_timer.timeout.connect(self._do_ui_refresh)
+
+        # sender results are drained from the worker's queue in batches on the GUI thread
+        self._drain_timer = QTimer(self)
+        self._drain_timer.setInterval(50)
+        self._drain_timer.timeout.connect(self._drain_results)
+
     def refresh_campaigns(self):
         self.history_tab.refresh()
 
@@ -359,42 +403,52 @@ class MainWindow(QMainWindow):
         if selected < 0:
             return None
         cid = int(tbl.item(selected, 0).text())
-        for c in db.get_campaigns():
-            if c['id'] == cid:
-                return c
-        return None
+        campaign = self.history_tab.campaigns_by_id.get(cid)
+        if campaign is None:
+            campaign = db.get_campaign(cid)
+        return campaign
 
     def start_sender_thread(self, campaign_id, subject, body, smtp_host, smtp_port, concurrency, smtp_user=None, smtp_pass=None, use_tls=False):
         # guard for existing thread
-        if self.sender_thread and self.sender_thread.isRunning():
+        if self.sender_thread and self.sender_thread.is_alive():
             QMessageBox.warning(self, "Sending active", "A sending job is already running.")
             return
 
-        # compute total recipients (so percentages can be computed)
-        recipients = db.get_recipients_for_campaign(campaign_id)
-        self.total_recipients = len(recipients)
+        # setup worker
+        self.sender_worker = SenderWorker(smtp_host=smtp_host, smtp_port=smtp_port,
+                                          smtp_user=smtp_user, smtp_pass=smtp_pass,
+                                          use_tls=use_tls, concurrency=concurrency)
+
+        # compute total recipients (so percentages can be computed); only the rows the sender
+        # will dispatch count, so a resumed campaign can still reach 100%
+        self.total_recipients = self.sender_worker.count_dispatchable(campaign_id)
         # reset counters
         self.sent_count = 0
         self.failed_count = 0
         self.responded_count = 0
 
         # update UI immediately
-        self._update_realtime_ui()
+        self._do_ui_refresh()
 
-        # setup worker
-        self.sender_thread = QThread()
-        self.sender_worker = SenderWorker(smtp_host=smtp_host, smtp_port=smtp_port,
-                                          smtp_user=smtp_user, smtp_pass=smtp_pass,
-                                          use_tls=use_tls, concurrency=concurrency)
-        self.sender_worker.moveToThread(self.sender_thread)
-        # wire signals (Qt will queue these because signals come from worker thread)
-        self.sender_worker.signals.progress.connect(self.email_tab.on_progress)
-        self.sender_worker.signals.status.connect(self.on_recipient_status)
+        # finished is emitted from the sender thread; Qt queues it to the GUI thread
         self.sender_worker.signals.finished.connect(self.on_sending_finished)
-        # start sending once thread starts
-        self.sender_thread.started.connect(lambda: self.sender_worker.start_campaign(campaign_id, 0, subject, body, smtp_user or "noreply@example.com"))
+        self.sender_thread = threading.Thread(target=self.sender_worker.start_campaign,
+                                              args=(campaign_id, 0, subject, body, smtp_user or "noreply@example.com"),
+                                              name="sender", daemon=True)
+        self._drain_timer.start()
         self.sender_thread.start()
 
+    def _drain_results(self, max_items: int = 5000):
+        if self.sender_worker is None:
+            return
+        results = self.sender_worker.results
+        for _ in range(max_items):
+            try:
+                recipient_id, status_text = results.get_nowait()
+            except queue.Empty:
+                break
+            self.on_recipient_status(recipient_id, status_text)
+
     @Slot(int, str)
     def on_recipient_status(self, recipient_id, status_text):
         """
@@ -412,23 +466,16 @@ class MainWindow(QMainWindow):
             # if you ever implement automatic response detection, worker can emit "responded"
             self.responded_count += 1
 
-        # persist status in DB (so history shows it)
-        try:
-            # map simple statuses to DB values
-            if st.startswith("sent"):
-                db.update_recipient_status(recipient_id, "sent", None, None)
-            elif st.startswith("responded"):
-                db.update_recipient_status(recipient_id, "responded", None, None)
-            else:
-                db.update_recipient_status(recipient_id, "failed", status_text, None)
-        except Exception:
-            # ignore DB errors here but you may want to log them
-            pass
-
-        # update UI
-        self._update_realtime_ui()
-
-    def _update_realtime_ui(self):
+        # the worker already persists each status; only the UI is updated here (coalesced)
+        self._schedule_ui_refresh()
+
+    def _schedule_ui_refresh(self):
+        if not self._ui_dirty:
+            self._ui_dirty = True
+            self._ui_timer.start()
+
+    def _do_ui_refresh(self):
+        self._ui_dirty = False
         total = max(1, self.total_recipients)  # avoid div-by-zero
         sent_pct = (self.sent_count / total) * 100
         failed_pct = (self.failed_count / total) * 100
@@ -451,25 +498,26 @@ class MainWindow(QMainWindow):
         self.email_tab.progress.setMaximum(100)
         self.email_tab.progress.setValue(int(overall_pct))
 
-        # process events safely (keeps UI responsive)
-        QApplication.processEvents()
-
     @Slot()
     def on_sending_finished(self):
         QMessageBox.information(self, "Done", "Sending finished")
         if self.sender_thread:
-            self.sender_thread.quit()
-            self.sender_thread.wait()
+            self.sender_thread.join()
+            self._drain_timer.stop()
+            # pick up whatever the worker queued after the last tick
+            self._drain_results(max_items=sys.maxsize)
             self.sender_worker = None
             self.sender_thread = None
 
         # final UI update
-        self._update_realtime_ui()
+        self._ui_timer.stop()
+        self._do_ui_refresh()
 
 
 def main():
     db.init_db()
     app = QApplication(sys.argv)
+    apply_text_palette(app)
     app.setStyleSheet(APP_STYLE)
     mw = MainWindow()
     mw.show()
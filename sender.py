@@ -2,27 +2,183 @@
 import smtplib
 import time
 import threading
+import queue
 from email.message import EmailMessage
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from PySide6.QtCore import QObject, Signal, Slot, QThread
-from db import update_recipient_status, get_recipients_for_campaign
-from email_validator import validate_email, EmailNotValidError
+from email.policy import SMTP as SMTP_POLICY
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from PySide6.QtCore import QObject, Signal
+from db import (DISPATCH_STATUSES, RecipientRow, bulk_update_recipient_status, count_recipients,
+                iter_recipients_for_campaign)
+from validation import is_valid_email
+from smtp_pipelining import PipeliningSMTP
 
 class SenderSignals(QObject):
-    progress = Signal(int, int)   # sent_count, total
-    status = Signal(int, str)     # recipient_id, status_text
     finished = Signal()
 
-class SenderWorker(QObject):
+STATUS_FLUSH_SIZE = 500       # flush buffered status updates after this many rows
+STATUS_FLUSH_INTERVAL = 0.25  # ... or after this many seconds
+POOL_IDLE_CHECK = 30.0        # NOOP-check pooled connections idle for longer than this (seconds)
+
+class SMTPConnectionPool:
+    """
+    Persistent, authenticated SMTP connections shared by the send threads. Connections are
+    opened lazily up to `size`, handed out with get() and returned with put(); a connection
+    that failed is passed to discard() instead and a fresh one is opened on the next get().
+    Idle connections are reused most-recently-returned first, so a send thread usually gets
+    back the connection it just used and rarely-touched ones are left to age out.
+    """
+    def __init__(self, host: str, port: int, user: str = None, password: str = None,
+                 use_tls: bool = False, size: int = 4):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_tls = use_tls
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)   # (connection, monotonic time it was returned)
+        self._open = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = PipeliningSMTP(self.host, self.port, timeout=15)
+        try:
+            if self.use_tls:
+                conn.starttls()
+            if self.user and self.password:
+                conn.login(self.user, self.password)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _quit(self, conn: smtplib.SMTP):
+        try:
+            conn.quit()
+        except Exception:
+            conn.close()
+
+    def _alive(self, conn: smtplib.SMTP) -> bool:
+        try:
+            return conn.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def get(self) -> smtplib.SMTP:
+        while True:
+            try:
+                conn, returned_at = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._open < self.size
+                    if can_open:
+                        self._open += 1
+                if can_open:
+                    try:
+                        return self._connect()
+                    except Exception:
+                        with self._lock:
+                            self._open -= 1
+                        raise
+                conn, returned_at = self._idle.get()
+            # the server may have dropped a connection that sat idle; check before reuse
+            if time.monotonic() - returned_at < POOL_IDLE_CHECK or self._alive(conn):
+                return conn
+            self.discard(conn)
+
+    def put(self, conn: smtplib.SMTP):
+        self._idle.put_nowait((conn, time.monotonic()))
+
+    def release(self, conn: smtplib.SMTP, error: Exception):
+        """
+        Return a connection after a failed send. Per-message refusals (sender/recipients refused,
+        data errors, unsupported extensions) leave the session usable since smtplib and
+        PipeliningSMTP reset it; a dropped link, a 421 or any non-SMTP error discards it.
+        """
+        reusable = (isinstance(error, smtplib.SMTPException)
+                    and not isinstance(error, smtplib.SMTPServerDisconnected)
+                    and getattr(error, "smtp_code", None) != 421
+                    and conn.sock is not None)
+        if reusable:
+            self.put(conn)
+        else:
+            self.discard(conn)
+
+    def discard(self, conn: smtplib.SMTP):
+        with self._lock:
+            self._open -= 1
+        self._quit(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(conn)
+
+_STOP = object()
+
+class StatusBatcher:
+    """
+    Collects (recipient_id, status, last_error, attempts) rows from the send threads and writes
+    them with one bulk_update_recipient_status() call per batch on a background thread, every
+    `max_rows` rows or `interval` seconds. A single flusher keeps each recipient's rows in order.
+    """
+    def __init__(self, max_rows: int = STATUS_FLUSH_SIZE, interval: float = STATUS_FLUSH_INTERVAL):
+        self.max_rows = max_rows
+        self.interval = interval
+        self._q = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="status-batcher", daemon=True)
+        self._thread.start()
+
+    def put(self, row: tuple):
+        self._q.put(row)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            rows = []
+            deadline = time.monotonic() + self.interval
+            while len(rows) < self.max_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = self._q.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                rows.append(row)
+            if rows:
+                try:
+                    bulk_update_recipient_status(rows)
+                except Exception:
+                    # keep flushing later batches; a failed batch only loses those status rows
+                    pass
+
+    def close(self):
+        """
+        Write everything queued so far and stop the flusher thread.
+        """
+        self._q.put(_STOP)
+        self._thread.join()
+
+class SenderWorker:
     """
-    Runs in a QThread. Uses ThreadPoolExecutor to send messages concurrently,
-    but progress/signals are emitted back to Qt thread via SenderSignals.
+    Runs on a plain background thread. Uses ThreadPoolExecutor to send messages concurrently;
+    per-recipient (recipient_id, status_text) results are put on self.results for the GUI to
+    drain on a timer, and only the one-shot finished signal goes through Qt.
     """
     def __init__(self, smtp_host: str, smtp_port: int, smtp_user: str = None, smtp_pass: str = None,
                  use_tls: bool = False, concurrency: int = 4, rate_per_sec: float = 1.0,
-                 retry_attempts: int = 2, retry_backoff: float = 2.0):
-        super().__init__()
+                 retry_attempts: int = 2, retry_backoff: float = 2.0, prevalidated: bool = False,
+                 bucket_size: float = None, max_attempts: int = None):
         self.signals = SenderSignals()
+        self.results = queue.SimpleQueue()
         self.smtp_host = smtp_host
         self.smtp_port = smtp_port
         self.smtp_user = smtp_user
@@ -32,87 +188,151 @@ class SenderWorker(QObject):
         self.rate_per_sec = rate_per_sec
         self.retry_attempts = retry_attempts
         self.retry_backoff = retry_backoff
+        # attempts are counted across runs; a recipient that has used max_attempts is no longer
+        # dispatched. None (the default) sets no cap, so failed rows are retried on every run.
+        self.max_attempts = max_attempts
+        # recipients were already checked at CSV import; skip the pre-send validation pass
+        self.prevalidated = prevalidated
+        # plain flag checked on the hot path; the event only serves to cut backoff sleeps short
+        self._stopped = False
         self._stop_event = threading.Event()
 
-        # simple token bucket rate limiter
-        self._last_sent = 0.0
+        # token bucket rate limiter: refills at rate_per_sec and allows bursts of up to
+        # bucket_size sends; the lock only guards the token arithmetic, never a sleep
+        self.bucket_size = bucket_size if bucket_size is not None else max(1.0, rate_per_sec)
+        self._tokens = self.bucket_size
+        self._last_refill = time.monotonic()
         self._lock = threading.Lock()
 
+        # persistent connections reused across messages; one per send thread at most
+        self._pool = SMTPConnectionPool(smtp_host, smtp_port, smtp_user, smtp_pass, use_tls, size=concurrency)
+
+        # status rows are written in bulk off the send threads; created per run in start_campaign
+        self._batcher = None
+
     def stop(self):
+        self._stopped = True
         self._stop_event.set()
 
     def _rate_limit(self):
-        with self._lock:
-            now = time.time()
-            interval = 1.0 / max(1e-6, self.rate_per_sec)
-            elapsed = now - self._last_sent
-            if elapsed < interval:
-                time.sleep(interval - elapsed)
-            self._last_sent = time.time()
-
-    def _send_single(self, recipient_row: dict, subject: str, body: str, sender_from: str) -> tuple:
+        rate = max(1e-6, self.rate_per_sec)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.bucket_size, self._tokens + (now - self._last_refill) * rate)
+                self._last_refill = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait_for = (1.0 - self._tokens) / rate
+            # sleep outside the lock, then compete for the refilled token again
+            time.sleep(wait_for)
+
+    def close(self):
+        self._pool.close()
+
+    def _record_status(self, rid: int, status: str, last_error: str = None, attempts: int = None):
+        self._batcher.put((rid, status, last_error, attempts))
+
+    def _build_template(self, subject: str, body: str, sender_from: str) -> bytes:
         """
-        Sends a single message; returns (recipient_id, status_text, attempts)
+        Serialize the campaign message (everything except To:) once, CRLF-terminated.
         """
-        rid = recipient_row['id']
-        email = recipient_row['email']
-        attempts = recipient_row.get('attempts', 0)
+        template = EmailMessage()
+        template["From"] = sender_from
+        template["Subject"] = subject
+        template.set_content(body)
+        return template.as_bytes(policy=SMTP_POLICY)
 
-        # validate email
+    def _send_single(self, recipient_row: RecipientRow, template: bytes, sender_from: str) -> tuple:
+        """
+        Sends a single message; returns (recipient_id, status_text, attempts). Never raises,
+        so the caller needs nothing but the future's result.
+        """
         try:
-            validate_email(email)
-        except EmailNotValidError as e:
-            update_recipient_status(rid, 'failed', str(e), attempts)
-            return (rid, f"invalid: {str(e)}", attempts)
+            return self._send_with_retries(recipient_row, template, sender_from)
+        except Exception as e:
+            return (recipient_row.id, f"error: {e}", recipient_row.attempts or 0)
+
+    def _send_with_retries(self, recipient_row: RecipientRow, template: bytes, sender_from: str) -> tuple:
+        rid = recipient_row.id
+        email = recipient_row.email
+        # attempts stored on the row are cumulative over every run of the campaign
+        base = recipient_row.attempts or 0
+        attempts = base
+        tries = self.retry_attempts + 1
+        if self.max_attempts is not None:
+            tries = min(tries, self.max_attempts - base)
 
         last_error = None
-        for attempt in range(1, self.retry_attempts + 2):
-            if self._stop_event.is_set():
+        for attempt in range(base + 1, base + tries + 1):
+            if self._stopped:
                 return (rid, "stopped", attempt-1)
+            conn = None
             try:
                 self._rate_limit()
-                msg = EmailMessage()
-                msg["From"] = sender_from
-                msg["To"] = email
-                msg["Subject"] = subject
-                msg.set_content(body)
-                # connect & send
-                with smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=15) as server:
-                    if self.use_tls:
-                        server.starttls()
-                    if self.smtp_user and self.smtp_pass:
-                        server.login(self.smtp_user, self.smtp_pass)
-                    server.send_message(msg)
-                update_recipient_status(rid, 'sent', None, attempt)
+                conn = self._pool.get()
+                # only the To: header differs between recipients
+                if email.isascii():
+                    conn.sendmail(sender_from, [email], b"To: " + email.encode("ascii") + b"\r\n" + template)
+                else:
+                    # internationalized address: raw UTF-8 header, which needs SMTPUTF8 (RFC 6531)
+                    conn.sendmail(sender_from, [email], b"To: " + email.encode("utf-8") + b"\r\n" + template,
+                                  mail_options=["SMTPUTF8"])
+                self._pool.put(conn)
+                self._record_status(rid, 'sent', None, attempt)
                 return (rid, "sent", attempt)
             except Exception as e:
+                # keep the connection unless the error left it unusable; then the next get() reconnects
+                if conn is not None:
+                    self._pool.release(conn, e)
                 last_error = str(e)
                 attempts = attempt
-                update_recipient_status(rid, 'failed', last_error, attempts)
-                # backoff
-                time.sleep(self.retry_backoff * attempt)
+                self._record_status(rid, 'failed', last_error, attempts)
+                if isinstance(e, smtplib.SMTPNotSupportedError):
+                    # e.g. no SMTPUTF8 for an internationalized address; retrying cannot help
+                    break
+                # backoff; returns early if stop() is called meanwhile
+                self._stop_event.wait(self.retry_backoff * (attempt - base))
         return (rid, f"failed: {last_error}", attempts)
 
-    @Slot(int, int, str, str)
+    def count_dispatchable(self, campaign_id: int) -> int:
+        """
+        Number of recipients start_campaign will send to, for the progress total.
+        """
+        return count_recipients(campaign_id, DISPATCH_STATUSES, self.max_attempts, dedupe=True)
+
     def start_campaign(self, campaign_id: int, total_expected: int, subject: str, body: str, sender_from: str = "noreply@example.com"):
-        # runs in this object's thread
-        recipients = get_recipients_for_campaign(campaign_id)
-        total = len(recipients)
-        sent_count = 0
-        with ThreadPoolExecutor(max_workers=self.concurrency) as ex:
-            futures = {ex.submit(self._send_single, r, subject, body, sender_from): r for r in recipients}
-            for fut in as_completed(futures):
-                if self._stop_event.is_set():
-                    break
-                recipient = futures[fut]
-                try:
-                    rid, status_text, attempts = fut.result()
-                except Exception as e:
-                    rid = recipient['id']
-                    status_text = f"error: {e}"
-                if status_text.startswith("sent"):
-                    sent_count += 1
-                # emit status for UI
-                self.signals.status.emit(rid, status_text)
-                self.signals.progress.emit(sent_count, total)
-        self.signals.finished.emit()
+        # runs on the sender thread
+        template = self._build_template(subject, body, sender_from)
+        # rows are streamed page by page from the DB and at most max_inflight sends are queued,
+        # so memory stays flat regardless of campaign size
+        max_inflight = 2 * self.concurrency
+        # only rows that still need sending, one per address (CSV re-imports can duplicate rows)
+        recipients = iter_recipients_for_campaign(campaign_id, DISPATCH_STATUSES, self.max_attempts, dedupe=True)
+        inflight = set()
+        self._batcher = StatusBatcher()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as ex:
+                while True:
+                    while len(inflight) < max_inflight and not self._stopped:
+                        r = next(recipients, None)
+                        if r is None:
+                            break
+                        if not self.prevalidated and not is_valid_email(r.email):
+                            self._record_status(r.id, 'failed', "invalid email address", r.attempts)
+                            self.results.put((r.id, "invalid: invalid email address"))
+                            continue
+                        inflight.add(ex.submit(self._send_single, r, template, sender_from))
+                    if not inflight:
+                        break
+                    done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        rid, status_text, attempts = fut.result()
+                        # hand the status to the UI
+                        self.results.put((rid, status_text))
+        finally:
+            recipients.close()
+            self.close()
+            self._batcher.close()
+            self.signals.finished.emit()
@@ -1,30 +1,70 @@
 # settings.py
 import os
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet, InvalidToken
 import base64
-import json
+import hashlib
 import secrets
+import threading
+from collections import OrderedDict
+try:
+    # orjson serializes straight to/from bytes; the stdlib json path needs an extra UTF-8 step
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    import json
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+    _loads = json.loads  # accepts UTF-8 bytes directly
 
 SALT_PATH = "smtp_salt.bin"
 STORE_PATH = "smtp_settings.bin"
 
+# Store layout: STORE_MAGIC + 12-byte nonce + AES-256-GCM ciphertext (tag included).
+# Files without the magic prefix are Fernet tokens from earlier versions; they are still
+# read, and the next save rewrites them in the new format.
+STORE_MAGIC = b"BEMGCM1\0"
+NONCE_SIZE = 12
+
+# Decrypted settings kept in memory only (never written anywhere), keyed by the store
+# file's mtime and a digest of the master password so repeat loads skip the KDF.
+_CACHE = {}
+
+# (key, AESGCM) pairs for (password, salt) combinations already run through the 200k-round
+# KDF this session, most recently used last. Keyed by a salted digest so the plaintext
+# password is never kept (functools.lru_cache on derive_key would keep it as the cache key).
+KEY_CACHE_SIZE = 8
+_key_cache = OrderedDict()
+_key_cache_lock = threading.Lock()
+
+# The salt never changes once written, so it is read from disk at most once per process
+_salt_cache: Optional[bytes] = None
+
 def _ensure_salt():
+    global _salt_cache
+    if _salt_cache is not None:
+        return _salt_cache
     if not os.path.exists(SALT_PATH):
         salt = secrets.token_bytes(16)
         with open(SALT_PATH, "wb") as f:
             f.write(salt)
-        return salt
     else:
         with open(SALT_PATH, "rb") as f:
-            return f.read()
+            salt = f.read()
+    _salt_cache = salt
+    return salt
 
 def derive_key(password: str, salt: bytes) -> bytes:
     """
-    Derive a 32-byte key suitable for Fernet from a password and salt.
+    Derive a raw 32-byte AES-256 key from a password and salt.
     """
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
@@ -33,20 +73,54 @@ def derive_key(password: str, salt: bytes) -> bytes:
         iterations=200_000,
         backend=default_backend()
     )
-    key = base64.urlsafe_b64encode(kdf.derive(password.encode("utf-8")))
-    return key
+    return kdf.derive(password.encode("utf-8"))
+
+def _get_cipher(password: str, salt: bytes) -> Tuple[bytes, AESGCM]:
+    """
+    Return (raw key, initialized AESGCM) for password and salt, deriving them on a cache miss.
+    """
+    cache_key = hashlib.blake2b(password.encode("utf-8"), key=salt, digest_size=16).digest()
+    with _key_cache_lock:
+        entry = _key_cache.get(cache_key)
+        if entry is not None:
+            _key_cache.move_to_end(cache_key)
+            return entry
+    key = derive_key(password, salt)
+    entry = (key, AESGCM(key))
+    with _key_cache_lock:
+        _key_cache[cache_key] = entry
+        while len(_key_cache) > KEY_CACHE_SIZE:
+            _key_cache.popitem(last=False)
+    return entry
+
+def _decrypt(key: bytes, aead: AESGCM, token: bytes) -> bytes:
+    try:
+        if token.startswith(STORE_MAGIC):
+            nonce = token[len(STORE_MAGIC):len(STORE_MAGIC) + NONCE_SIZE]
+            return aead.decrypt(nonce, token[len(STORE_MAGIC) + NONCE_SIZE:], None)
+        # legacy Fernet token; Fernet takes the same key base64-encoded
+        return Fernet(base64.urlsafe_b64encode(key)).decrypt(token)
+    except (InvalidTag, InvalidToken) as e:
+        raise ValueError("Invalid master password or corrupted settings") from e
+
+def clear_key_cache() -> None:
+    """
+    Forget every derived key and decrypted settings (e.g. on logout).
+    """
+    with _key_cache_lock:
+        _key_cache.clear()
+    _CACHE.clear()
 
 def save_smtp_settings(password: str, settings: Dict[str, str]) -> None:
     """
     Encrypt and store SMTP settings dict (host, port, username, password, use_tls).
     """
-    salt = _ensure_salt()
-    key = derive_key(password, salt)
-    f = Fernet(key)
-    raw = json.dumps(settings).encode("utf-8")
-    token = f.encrypt(raw)
+    _, aead = _get_cipher(password, _ensure_salt())
+    nonce = os.urandom(NONCE_SIZE)
+    token = STORE_MAGIC + nonce + aead.encrypt(nonce, _dumps(settings), None)
     with open(STORE_PATH, "wb") as fh:
         fh.write(token)
+    _CACHE.clear()
 
 def load_smtp_settings(password: str) -> Optional[Dict[str, str]]:
     """
@@ -54,17 +128,18 @@ def load_smtp_settings(password: str) -> Optional[Dict[str, str]]:
     """
     if not os.path.exists(STORE_PATH):
         return None
-    salt = _ensure_salt()
-    key = derive_key(password, salt)
-    f = Fernet(key)
+    cache_key = (os.stat(STORE_PATH).st_mtime_ns,
+                 hashlib.blake2b(password.encode("utf-8"), digest_size=16).digest())
+    cached = _CACHE.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+    key, aead = _get_cipher(password, _ensure_salt())
     with open(STORE_PATH, "rb") as fh:
         token = fh.read()
-    try:
-        raw = f.decrypt(token)
-    except InvalidToken as e:
-        raise ValueError("Invalid master password or corrupted settings") from e
-    settings = json.loads(raw.decode("utf-8"))
-    return settings
+    settings = _loads(_decrypt(key, aead, token))
+    _CACHE.clear()  # only the current file version is worth keeping
+    _CACHE[cache_key] = settings
+    return dict(settings)
 
 def settings_exist() -> bool:
     return os.path.exists(STORE_PATH)
@@ -0,0 +1,81 @@
+# smtp_pipelining.py
+import re
+import smtplib
+
+class PipeliningSMTP(smtplib.SMTP):
+    """
+    smtplib.SMTP whose sendmail() writes MAIL, RCPT and DATA back-to-back and then reads the
+    replies when the server advertises PIPELINING (RFC 2920), instead of one round trip per
+    command. If CHUNKING (RFC 3030) is advertised too, the message goes out in the same write
+    as a single BDAT ... LAST chunk, without dot-stuffing. Otherwise smtplib's sendmail() is used.
+    """
+    def _reply(self):
+        code, resp = self.getreply()
+        if code == 421:
+            # service shutting down; the server closes the channel
+            self.close()
+            raise smtplib.SMTPServerDisconnected(resp)
+        return code, resp
+
+    def _reset(self):
+        try:
+            self.rset()
+        except smtplib.SMTPServerDisconnected:
+            pass
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        self.ehlo_or_helo_if_needed()
+        if (not self.has_extn("pipelining") or isinstance(msg, str)
+                or any(o.lower() == "smtputf8" for o in mail_options)):
+            return super().sendmail(from_addr, to_addrs, msg, mail_options, rcpt_options)
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+        chunking = self.has_extn("chunking")
+        if chunking and msg.count(b"\n") != msg.count(b"\r\n"):
+            # BDAT sends the bytes verbatim, so line endings must already be CRLF
+            msg = re.sub(rb"\r\n|\r|\n", b"\r\n", msg)
+
+        opts = list(mail_options)
+        if self.has_extn("size"):
+            opts.insert(0, "size=%d" % len(msg))
+        mail_opts = " " + " ".join(opts) if opts else ""
+        rcpt_opts = " " + " ".join(rcpt_options) if rcpt_options else ""
+        cmds = ["mail FROM:%s%s\r\n" % (smtplib.quoteaddr(from_addr), mail_opts)]
+        cmds += ["rcpt TO:%s%s\r\n" % (smtplib.quoteaddr(addr), rcpt_opts) for addr in to_addrs]
+        if chunking:
+            cmds.append("BDAT %d LAST\r\n" % len(msg))
+            self.send("".join(cmds).encode(self.command_encoding) + msg)
+        else:
+            cmds.append("data\r\n")
+            self.send("".join(cmds))
+
+        mail_code, mail_resp = self._reply()
+        senderrs = {}
+        for addr in to_addrs:
+            code, resp = self._reply()
+            if code not in (250, 251):
+                senderrs[addr] = (code, resp)
+        code, resp = self._reply()   # BDAT result, or the DATA go-ahead
+
+        if mail_code != 250 or len(senderrs) == len(to_addrs):
+            if not chunking and code == 354:
+                # the server accepted DATA anyway; end the empty message before resetting
+                self.send(b".\r\n")
+                self._reply()
+            self._reset()
+            if mail_code != 250:
+                raise smtplib.SMTPSenderRefused(mail_code, mail_resp, from_addr)
+            raise smtplib.SMTPRecipientsRefused(senderrs)
+        if not chunking:
+            if code != 354:
+                self._reset()
+                raise smtplib.SMTPDataError(code, resp)
+            q = re.sub(rb"(?m)^\.", b"..", msg)
+            if q[-2:] != b"\r\n":
+                q += b"\r\n"
+            self.send(q + b".\r\n")
+            code, resp = self._reply()
+        if code != 250:
+            self._reset()
+            raise smtplib.SMTPDataError(code, resp)
+        return senderrs
@@ -0,0 +1,174 @@
+# tests/test_db.py
+import queue
+import sqlite3
+
+import pytest
+
+import db
+
+# recipients as created before status became an INTEGER column
+BASELINE_SCHEMA = """
+CREATE TABLE campaigns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    subject TEXT,
+    body TEXT,
+    created_at TEXT
+);
+CREATE TABLE recipients (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    campaign_id INTEGER,
+    email TEXT NOT NULL,
+    name TEXT,
+    status TEXT DEFAULT 'pending',
+    last_error TEXT,
+    attempts INTEGER DEFAULT 0,
+    FOREIGN KEY(campaign_id) REFERENCES campaigns(id)
+);
+CREATE TABLE campaign_stats (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    campaign_id INTEGER,
+    sent_count INTEGER DEFAULT 0,
+    failed_count INTEGER DEFAULT 0,
+    responded_count INTEGER DEFAULT 0,
+    total_recipients INTEGER,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY(campaign_id) REFERENCES campaigns(id)
+);
+"""
+
+BASELINE_ROWS = [
+    # (email, name, status, last_error, attempts)
+    ("a@example.com", "A", "sent", None, 1),
+    ("b@example.com", "B", "failed", "550 no such user", 3),
+    ("c@example.com", "C", "pending", None, 0),
+    ("A@Example.com", "A again", "pending", None, 0),
+    ("name", "name", "failed", "invalid email", 0),
+]
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(db, "_pool", queue.Queue(maxsize=db.READ_POOL_SIZE))
+    monkeypatch.setattr(db, "_stats", {})
+    monkeypatch.setattr(db, "_stats_q", queue.Queue())
+    with db._write_lock:
+        monkeypatch.setattr(db, "_writer", None)
+    yield
+    db.flush_stats()
+    with db._write_lock:
+        if db._writer is not None:
+            db._writer.close()
+            db._writer = None
+    while not db._pool.empty():
+        db._pool.get_nowait().close()
+
+
+def make_baseline_db(rows=BASELINE_ROWS):
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO campaigns (name, subject, body) VALUES ('old', 's', 'b')")
+    conn.executemany("INSERT INTO recipients (campaign_id, email, name, status, last_error, attempts) "
+                     "VALUES (1, ?, ?, ?, ?, ?)", rows)
+    conn.execute("INSERT INTO campaign_stats (campaign_id, sent_count, failed_count, total_recipients) "
+                 "VALUES (1, 1, 2, ?)", (len(rows),))
+    conn.commit()
+    conn.close()
+
+
+def raw(sql, params=()):
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def test_migrates_text_status_to_codes():
+    make_baseline_db()
+    db.init_db()
+
+    columns = {r[1]: r[2] for r in raw("PRAGMA table_info(recipients)")}
+    assert columns["status"] == "INTEGER"
+    assert "responded_at" in columns
+    assert raw("SELECT id, status, last_error, attempts FROM recipients ORDER BY id") == [
+        (1, db.STATUS["sent"], None, 1),
+        (2, db.STATUS["failed"], "550 no such user", 3),
+        (3, db.STATUS["pending"], None, 0),
+        (4, db.STATUS["pending"], None, 0),
+        (5, db.STATUS["failed"], "invalid email", 0),
+    ]
+    assert [r.status for r in db.get_recipients_for_campaign(1)] == [
+        "sent", "failed", "pending", "pending", "failed"]
+
+
+def test_migration_is_not_repeated():
+    make_baseline_db()
+    db.init_db()
+    db.init_db()
+    assert len(db.get_recipients_for_campaign(1)) == len(BASELINE_ROWS)
+
+
+def test_failed_migration_rolls_back(monkeypatch):
+    make_baseline_db()
+    # the copy into a rebuilt table without the old columns fails halfway through
+    monkeypatch.setattr(db, "_RECIPIENTS_DDL", "CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY)")
+    with pytest.raises(sqlite3.OperationalError):
+        db.init_db()
+
+    assert raw("SELECT status FROM recipients ORDER BY id") == [(r[2],) for r in BASELINE_ROWS]
+    assert not raw("SELECT name FROM sqlite_master WHERE name = 'recipients_migrated'")
+    with db._write_lock:
+        assert not db._get_writer().in_transaction
+
+
+def test_dispatch_filter_skips_sent_duplicates_and_exhausted_rows():
+    make_baseline_db()
+    db.init_db()
+
+    rows = db.get_recipients_for_campaign(1, db.DISPATCH_STATUSES, max_attempts=3, dedupe=True)
+    # a@ is sent and its case-variant duplicate is not picked; b@ has used up its attempts
+    assert [r.email for r in rows] == ["c@example.com", "name"]
+    assert db.count_recipients(1, db.DISPATCH_STATUSES, 3, dedupe=True) == 2
+
+    # without a cap the failed row is picked up again
+    rows = db.get_recipients_for_campaign(1, db.DISPATCH_STATUSES, dedupe=True)
+    assert [r.email for r in rows] == ["b@example.com", "c@example.com", "name"]
+    assert db.count_recipients(1) == len(BASELINE_ROWS)
+
+
+def test_iter_recipients_pages_in_id_order(monkeypatch):
+    monkeypatch.setattr(db, "RECIPIENT_PAGE_SIZE", 3)
+    db.init_db()
+    cid = db.create_campaign("c", "s", "b")
+    emails = [f"user{i}@example.com" for i in range(10)]
+    db.add_recipients(cid, zip(emails, emails), len(emails))
+
+    rows = list(db.iter_recipients_for_campaign(cid))
+    assert [r.email for r in rows] == emails
+    assert [r.id for r in rows] == sorted(r.id for r in rows)
+
+
+def test_status_updates_keep_stats_in_step():
+    make_baseline_db()
+    db.init_db()
+    assert db.get_campaign_stats(1) == {
+        "sent_count": 1, "failed_count": 2, "responded_count": 0, "total": 5}
+
+    db.bulk_update_recipient_status([
+        (3, "sent", None, 1),
+        (2, "sent", None, 4),
+        (5, "failed", "invalid email", None),  # unchanged status: no delta
+    ])
+    db.update_recipient_status(1, "responded", responded_at="2026-01-01T00:00:00Z")
+
+    assert db.get_campaign_stats(1) == {
+        "sent_count": 2, "failed_count": 1, "responded_count": 1, "total": 5}
+    assert raw("SELECT attempts FROM recipients WHERE id IN (2, 5) ORDER BY id") == [(4,), (0,)]
+
+    db.flush_stats()
+    # the writer thread may have picked up some deltas itself; wait for its commit
+    db._submit_write(lambda conn: None)
+    assert raw("SELECT sent_count, failed_count, responded_count FROM campaign_stats "
+               "WHERE campaign_id = 1") == [(2, 1, 1)]
@@ -0,0 +1,78 @@
+# tests/test_settings.py
+import base64
+import json
+
+import pytest
+
+pytest.importorskip("cryptography")
+from cryptography.fernet import Fernet
+
+import settings
+
+SETTINGS = {"host": "smtp.example.com", "port": "587", "username": "user",
+            "password": "secret", "use_tls": True}
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SALT_PATH", str(tmp_path / "smtp_salt.bin"))
+    monkeypatch.setattr(settings, "STORE_PATH", str(tmp_path / "smtp_settings.bin"))
+    monkeypatch.setattr(settings, "_salt_cache", None)
+    settings.clear_key_cache()
+    yield
+    settings.clear_key_cache()
+
+
+def write_legacy_store(password, data):
+    # the format written before AES-GCM: a Fernet token under the base64 PBKDF2 key
+    salt = settings._ensure_salt()
+    key = base64.urlsafe_b64encode(settings.derive_key(password, salt))
+    with open(settings.STORE_PATH, "wb") as fh:
+        fh.write(Fernet(key).encrypt(json.dumps(data).encode("utf-8")))
+
+
+def test_reads_legacy_fernet_store():
+    write_legacy_store("master", SETTINGS)
+    settings.clear_key_cache()
+    assert settings.load_smtp_settings("master") == SETTINGS
+
+
+def test_save_after_legacy_load_rewrites_as_gcm():
+    write_legacy_store("master", SETTINGS)
+    settings.save_smtp_settings("master", settings.load_smtp_settings("master"))
+    with open(settings.STORE_PATH, "rb") as fh:
+        assert fh.read().startswith(settings.STORE_MAGIC)
+    settings.clear_key_cache()
+    assert settings.load_smtp_settings("master") == SETTINGS
+
+
+def test_gcm_round_trip():
+    settings.save_smtp_settings("master", SETTINGS)
+    with open(settings.STORE_PATH, "rb") as fh:
+        token = fh.read()
+    assert token.startswith(settings.STORE_MAGIC)
+    assert b"secret" not in token
+    settings.clear_key_cache()
+    assert settings.load_smtp_settings("master") == SETTINGS
+
+
+@pytest.mark.parametrize("legacy", [False, True])
+def test_wrong_password_raises_value_error(legacy):
+    if legacy:
+        write_legacy_store("master", SETTINGS)
+    else:
+        settings.save_smtp_settings("master", SETTINGS)
+    with pytest.raises(ValueError):
+        settings.load_smtp_settings("not-the-password")
+
+
+def test_tampered_store_raises_value_error():
+    settings.save_smtp_settings("master", SETTINGS)
+    with open(settings.STORE_PATH, "rb") as fh:
+        token = bytearray(fh.read())
+    token[-1] ^= 1
+    with open(settings.STORE_PATH, "wb") as fh:
+        fh.write(bytes(token))
+    settings.clear_key_cache()
+    with pytest.raises(ValueError):
+        settings.load_smtp_settings("master")
@@ -0,0 +1,173 @@
+# tests/test_smtp_pipelining.py
+import smtplib
+import socket
+import threading
+
+import pytest
+
+from smtp_pipelining import PipeliningSMTP
+
+MESSAGE = b"Subject: s\r\n\r\n.dot line\r\nbody\r\n"
+
+
+class ScriptedServer:
+    """
+    Minimal SMTP server on a local socket. With PIPELINING advertised, replies to MAIL/RCPT are
+    held back until DATA/BDAT arrives, so a client that waits for each reply would time out.
+    """
+    def __init__(self, extensions, accept_data_without_recipients=False):
+        self.extensions = extensions
+        self.accept_data_without_recipients = accept_data_without_recipients
+        self.commands = []
+        self.bodies = []
+        self._sock = socket.socket()
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(1)
+        self.port = self._sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        conn, _ = self._sock.accept()
+        f = conn.makefile("rb")
+        pipelining = b"PIPELINING" in self.extensions
+        held = []
+        accepted = 0
+
+        def reply(line):
+            held.append(line)
+            if not pipelining:
+                flush()
+
+        def flush():
+            conn.sendall(b"".join(held))
+            held.clear()
+
+        conn.sendall(b"220 test ready\r\n")
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            self.commands.append(line)
+            verb = line.split(b" ", 1)[0].strip().upper()
+            if verb == b"EHLO":
+                conn.sendall(b"250-test\r\n" + b"".join(b"250-" + e + b"\r\n" for e in self.extensions)
+                             + b"250 OK\r\n")
+            elif verb == b"MAIL":
+                accepted = 0
+                reply(b"550 sender refused\r\n" if b"bad-sender" in line else b"250 ok\r\n")
+            elif verb == b"RCPT":
+                if b"bad" in line:
+                    reply(b"550 user unknown\r\n")
+                else:
+                    accepted += 1
+                    reply(b"250 ok\r\n")
+            elif verb == b"BDAT":
+                self.bodies.append(f.read(int(line.split()[1])))
+                reply(b"250 queued\r\n" if accepted else b"554 no valid recipients\r\n")
+                flush()
+            elif verb == b"DATA":
+                if not accepted and not self.accept_data_without_recipients:
+                    reply(b"554 no valid recipients\r\n")
+                    flush()
+                    continue
+                reply(b"354 go ahead\r\n")
+                flush()
+                body = b""
+                while True:
+                    data_line = f.readline()
+                    if data_line == b".\r\n":
+                        break
+                    body += data_line
+                self.bodies.append(body)
+                conn.sendall(b"250 queued\r\n" if accepted else b"554 no valid recipients\r\n")
+            elif verb == b"QUIT":
+                conn.sendall(b"221 bye\r\n")
+                break
+            else:
+                conn.sendall(b"250 ok\r\n")
+        conn.close()
+        self._sock.close()
+
+    def verbs(self):
+        return [c.split(b" ", 1)[0].strip().upper() for c in self.commands]
+
+    def join(self):
+        self._thread.join(timeout=5)
+
+
+SERVERS = {
+    "pipelining+chunking": [b"PIPELINING", b"CHUNKING", b"SIZE 10000"],
+    "pipelining": [b"PIPELINING"],
+    "plain": [],
+}
+
+
+@pytest.fixture(params=list(SERVERS))
+def server(request):
+    srv = ScriptedServer(SERVERS[request.param])
+    yield srv
+    srv.join()
+
+
+def connect(srv):
+    return PipeliningSMTP("127.0.0.1", srv.port, timeout=5)
+
+
+def test_partial_refusal_returns_refused_recipients(server):
+    client = connect(server)
+    assert client.sendmail("a@x.com", ["b@y.com", "bad@y.com"], MESSAGE) == {"bad@y.com": (550, b"user unknown")}
+    client.quit()
+    server.join()
+    if b"CHUNKING" in server.extensions:
+        # sent verbatim in one BDAT chunk, no dot-stuffing
+        assert server.bodies == [MESSAGE]
+        assert b"BDAT %d LAST\r\n" % len(MESSAGE) in server.commands
+        assert b"mail FROM:<a@x.com> size=%d\r\n" % len(MESSAGE) in server.commands
+    else:
+        assert server.bodies == [MESSAGE.replace(b"\r\n.dot", b"\r\n..dot")]
+
+
+def test_all_recipients_refused_resets_and_session_stays_usable(server):
+    client = connect(server)
+    with pytest.raises(smtplib.SMTPRecipientsRefused) as exc:
+        client.sendmail("a@x.com", ["bad@y.com"], MESSAGE)
+    assert exc.value.recipients == {"bad@y.com": (550, b"user unknown")}
+    assert client.sendmail("a@x.com", ["c@y.com"], MESSAGE) == {}
+    client.quit()
+    server.join()
+    assert b"RSET" in server.verbs()
+    assert len(server.bodies) == 1 + (b"CHUNKING" in server.extensions)
+
+
+def test_sender_refused(server):
+    client = connect(server)
+    with pytest.raises(smtplib.SMTPSenderRefused):
+        client.sendmail("bad-sender@x.com", ["c@y.com"], MESSAGE)
+    assert client.sendmail("a@x.com", ["c@y.com"], MESSAGE) == {}
+    client.quit()
+    server.join()
+    assert b"RSET" in server.verbs()
+
+
+def test_data_accepted_after_all_recipients_refused():
+    # a server may answer the pipelined DATA with 354 even though every RCPT failed;
+    # the client must end the empty message before resetting
+    server = ScriptedServer([b"PIPELINING"], accept_data_without_recipients=True)
+    client = connect(server)
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        client.sendmail("a@x.com", ["bad@y.com"], MESSAGE)
+    assert client.sendmail("a@x.com", ["c@y.com"], MESSAGE) == {}
+    client.quit()
+    server.join()
+    assert server.bodies[0] == b""
+    assert b"RSET" in server.verbs()
+
+
+def test_bdat_normalizes_bare_newlines():
+    server = ScriptedServer([b"PIPELINING", b"CHUNKING"])
+    client = connect(server)
+    client.sendmail("a@x.com", ["c@y.com"], b"Subject: s\n\nbody\n")
+    client.quit()
+    server.join()
+    assert server.bodies == [b"Subject: s\r\n\r\nbody\r\n"]
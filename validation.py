@@ -0,0 +1,13 @@
+# validation.py
+try:
+    # google-re2 matches in linear time without backtracking; same API for this pattern
+    import re2 as re
+except ImportError:
+    import re
+
+EMAIL_REGEX = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def is_valid_email(email: str) -> bool:
+    # cheap substring test rejects address-less rows before entering the regex engine
+    return "@" in email and EMAIL_REGEX.match(email) is not None